@@ -46,6 +46,7 @@ def create_pipeline(SAMPLE_RATE):
 
 def init_diart(SAMPLE_RATE):
     inference, ws_source = create_pipeline(SAMPLE_RATE)
+    loop = asyncio.get_running_loop()
 
     def diar_hook(result):
         """
@@ -59,15 +60,15 @@ def init_diart(SAMPLE_RATE):
         for speaker in annotation._labels:            
             segments_beg = annotation._labels[speaker].segments_boundaries_[0]
             segments_end = annotation._labels[speaker].segments_boundaries_[-1]
-            asyncio.create_task(
-            l_speakers_queue.put({"speaker": speaker, "beg": segments_beg, "end": segments_end})
-        )
+            # Diart may call the hook from its own thread, where there is no running loop
+            loop.call_soon_threadsafe(
+                l_speakers_queue.put_nowait, {"speaker": speaker, "beg": segments_beg, "end": segments_end}
+            )
 
     l_speakers_queue = asyncio.Queue()
     inference.attach_hooks(diar_hook)
 
     # Launch Diart in a background thread
-    loop = asyncio.get_event_loop()
     diar_future = loop.run_in_executor(None, inference)
     return inference, l_speakers_queue, ws_source
 
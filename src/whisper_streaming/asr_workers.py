@@ -0,0 +1,165 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+
+from .whisper_online import asr_class, create_asr, warmup_asr
+
+logger = logging.getLogger(__name__)
+
+# Shared memory slots are sized for this much float32 audio up front, and grown on demand
+MIN_SLOT_BYTES = 16000 * 30 * 4
+
+# Model held by the current worker process, loaded by _init_worker
+_worker_asr = None
+
+
+def _init_worker(args, warmup_file, n_threads):
+    global _worker_asr
+    # Share the cores between the workers instead of each one using all of them
+    torch.set_num_threads(n_threads)
+    if not args.cpu_threads:
+        args.cpu_threads = n_threads  # CTranslate2 has its own thread pool
+    _worker_asr = create_asr(args)
+    warmup_asr(_worker_asr, warmup_file)
+
+
+def _ready():
+    return True
+
+
+def _transcribe_shared(slot_name, n_samples, init_prompt):
+    slot = SharedMemory(name=slot_name)
+    try:
+        # Copied out, so the slot can be closed whatever the backend keeps a reference to
+        audio = np.ndarray((n_samples,), dtype=np.float32, buffer=slot.buf).copy()
+    finally:
+        slot.close()
+    res = _worker_asr.transcribe(audio, init_prompt=init_prompt)
+    # Plain tokens and end times are sent back instead of the backend's segment objects
+    return _worker_asr.ts_words(res), _worker_asr.segments_end_ts(res)
+
+
+class ASRProcessPool:
+    """
+    Stands in for an ASR backend in OnlineASRProcessor, but runs transcribe in
+    `n_workers` subprocesses that each hold their own model, so that concurrent
+    sessions are not serialized by the GIL or by a single model instance.
+
+    Audio goes through reusable shared memory slots: only the slot name, the
+    number of samples and the prompt are pickled to the workers. Requests are
+    served by whichever worker is free first. transcribe blocks until the result
+    is back, so it should be called off the event loop. Words and segment ends
+    are extracted in the worker: transcribe returns them as a
+    (tokens, segment end times) pair, which ts_words and segments_end_ts unpack.
+
+    If a worker dies, e.g. out of memory or on a CUDA error, the pool is
+    replaced by a new one and the failed calls are retried once on it.
+    """
+
+    def __init__(self, args, n_workers, warmup_file=None):
+        if args.backend == "openai-api":
+            raise ValueError("The openai-api backend has no local model to run in worker processes.")
+        self.sep = asr_class(args.backend).sep
+        self.n_workers = n_workers
+        self._initargs = (args, warmup_file, max(1, os.cpu_count() // n_workers))
+        self._executor_lock = threading.Lock()
+        self.executor = self._new_executor()
+        # Two slots per worker, so the next request can be written while one is transcribed.
+        # None marks a slot that is not allocated yet.
+        self._slots = queue.Queue()
+        for _ in range(2 * n_workers):
+            self._slots.put(None)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context("spawn"),  # CUDA cannot be used in forked processes
+            initializer=_init_worker,
+            initargs=self._initargs,
+        )
+
+    def _replace_broken(self, executor):
+        with self._executor_lock:
+            if self.executor is not executor:
+                return  # Already replaced by another session's call
+            logger.error(
+                "An ASR worker process died (out of memory or a CUDA error?). "
+                "Restarting the ASR worker pool, the pending transcriptions are retried once the models are loaded again."
+            )
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._new_executor()
+
+    def _run(self, *task):
+        executor = self.executor
+        try:
+            return executor.submit(*task).result()
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise
+
+    def start(self):
+        """Spawns the workers and waits for their models to be loaded and warmed up."""
+        for future in [self.executor.submit(_ready) for _ in range(self.n_workers)]:
+            future.result()
+        logger.info(f"{self.n_workers} ASR worker processes are ready.")
+
+    def transcribe(self, audio, init_prompt=""):
+        slot = self._slots.get()
+        try:
+            if slot is None or slot.size < audio.nbytes:
+                if slot is not None:
+                    slot.close()
+                    slot.unlink()
+                slot = SharedMemory(create=True, size=max(audio.nbytes, MIN_SLOT_BYTES))
+            np.ndarray(audio.shape, dtype=np.float32, buffer=slot.buf)[:] = audio
+            task = (_transcribe_shared, slot.name, len(audio), init_prompt)
+            try:
+                return self._run(*task)
+            except BrokenProcessPool:
+                return self._run(*task)
+        finally:
+            self._slots.put(slot)
+
+    def ts_words(self, res):
+        tokens, _ = res
+        return tokens
+
+    def segments_end_ts(self, res):
+        _, ends = res
+        return ends
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        while not self._slots.empty():
+            slot = self._slots.get_nowait()
+            if slot is not None:
+                slot.close()
+                slot.unlink()
+
+
+class LockedTokenizer:
+    """
+    Serializes the calls to a sentence tokenizer shared by sessions whose
+    process_iter runs on executor threads. MosesSentenceSplitter talks to a
+    subprocess through unlocked pipes, so concurrent calls would interleave.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        with self.lock:
+            return self.tokenizer(text)
+
+    def split(self, text):
+        with self.lock:
+            return self.tokenizer.split(text)
@@ -14,9 +14,12 @@ class ASRBase:
     sep = " "  # join transcribe words with this character (" " for whisper_timestamped,
               # "" for faster-whisper because it emits the spaces when needed)
 
-    def __init__(self, lan, modelsize=None, cache_dir=None, model_dir=None, logfile=sys.stderr):
+    def __init__(self, lan, modelsize=None, cache_dir=None, model_dir=None, logfile=sys.stderr,
+                 compute_type=None, cpu_threads=0):
         self.logfile = logfile
         self.transcribe_kargs = {}
+        self.compute_type = compute_type  # None lets the backend pick one for the device
+        self.cpu_threads = cpu_threads
         if lan == "auto":
             self.original_language = None
         else:
@@ -103,12 +106,14 @@ class FasterWhisperASR(ASRBase):
         else:
             raise ValueError("Either modelsize or model_dir must be set")
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        compute_type = "float16" if device == "cuda" else "float32"
+        compute_type = self.compute_type or ("int8_float16" if device == "cuda" else "int8")
+        logger.debug(f"Running faster-whisper on {device} with {compute_type} weights.")
 
         model = WhisperModel(
             model_size_or_path,
             device=device,
             compute_type=compute_type,
+            cpu_threads=self.cpu_threads,
             download_root=cache_dir,
         )
         return model
@@ -165,7 +170,11 @@ class MLXWhisper(ASRBase):
             raise ValueError("Either modelsize or model_dir must be set")
 
         self.model_size_or_path = model_size_or_path
-        dtype = mx.float16
+        # mlx_whisper.transcribe reloads the model unless it is held with the dtype matching its fp16 option
+        if self.compute_type not in (None, "float16", "float32"):
+            logger.warning(f"MLX Whisper runs in float16 or float32 only. {self.compute_type} is ignored, float16 is used.")
+        self.fp16 = self.compute_type != "float32"
+        dtype = mx.float16 if self.fp16 else mx.float32
         ModelHolder.get_model(model_size_or_path, dtype)
         return transcribe
 
@@ -201,6 +210,7 @@ class MLXWhisper(ASRBase):
             word_timestamps=True,
             condition_on_previous_text=True,
             path_or_hf_repo=self.model_size_or_path,
+            fp16=self.fp16,
         )
         return segments.get("segments", [])
 
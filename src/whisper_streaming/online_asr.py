@@ -39,19 +39,17 @@ class HypothesisBuffer:
             first_token = self.new[0]
             if abs(first_token.start - self.last_committed_time) < 1:
                 if self.committed_in_buffer:
-                    committed_len = len(self.committed_in_buffer)
-                    new_len = len(self.new)
                     # Try to match 1 to 5 consecutive tokens
-                    max_ngram = min(min(committed_len, new_len), 5)
+                    max_ngram = min(len(self.committed_in_buffer), len(self.new), 5)
+                    committed_texts = [token.text for token in self.committed_in_buffer[-max_ngram:]]
+                    new_texts = [token.text for token in self.new[:max_ngram]]
                     for i in range(1, max_ngram + 1):
-                        committed_ngram = " ".join(token.text for token in self.committed_in_buffer[-i:])
-                        new_ngram = " ".join(token.text for token in self.new[:i])
+                        committed_ngram = " ".join(committed_texts[-i:])
+                        new_ngram = " ".join(new_texts[:i])
                         if committed_ngram == new_ngram:
-                            removed = []
-                            for _ in range(i):
-                                removed_token = self.new.pop(0)
-                                removed.append(repr(removed_token))
-                            logger.debug(f"Removing last {i} words: {' '.join(removed)}")
+                            removed = self.new[:i]
+                            del self.new[:i]
+                            logger.debug(f"Removing last {i} words: {' '.join(repr(token) for token in removed)}")
                             break
 
     def flush(self) -> List[ASRToken]:
@@ -59,20 +57,16 @@ class HypothesisBuffer:
         Returns the committed chunk, defined as the longest common prefix
         between the previous hypothesis and the new tokens.
         """
-        committed: List[ASRToken] = []
-        while self.new:
-            current_new = self.new[0]
-            if not self.buffer:
+        common = 0
+        for current_new, previous in zip(self.new, self.buffer):
+            if current_new.text != previous.text:
                 break
-            if current_new.text == self.buffer[0].text:
-                committed.append(current_new)
-                self.last_committed_word = current_new.text
-                self.last_committed_time = current_new.end
-                self.buffer.pop(0)
-                self.new.pop(0)
-            else:
-                break
-        self.buffer = self.new
+            common += 1
+        committed: List[ASRToken] = self.new[:common]
+        if committed:
+            self.last_committed_word = committed[-1].text
+            self.last_committed_time = committed[-1].end
+        self.buffer = self.new[common:]
         self.new = []
         self.committed_in_buffer.extend(committed)
         return committed
@@ -81,8 +75,10 @@ class HypothesisBuffer:
         """
         Remove tokens (from the beginning) that have ended before `time`.
         """
-        while self.committed_in_buffer and self.committed_in_buffer[0].end <= time:
-            self.committed_in_buffer.pop(0)
+        k = 0
+        while k < len(self.committed_in_buffer) and self.committed_in_buffer[k].end <= time:
+            k += 1
+        del self.committed_in_buffer[:k]
 
 
 
@@ -0,0 +1,116 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# int16 -> float32 scale, a power of two so the conversion is exact
+PCM_SCALE = np.float32(1.0 / 32768.0)
+# Mean square of int16 samples under which a chunk may count as silence (about -45 dBFS RMS)
+SILENCE_ENERGY = (32768 * 10 ** (-45 / 20)) ** 2
+# Share of consecutive samples changing sign under which a quiet chunk counts as silence.
+# Quiet chunks with a higher rate are kept, as they may hold unvoiced consonants...
+SILENCE_ZERO_CROSSING_RATE = 0.3
+# ...unless they are 10 dB below SILENCE_ENERGY, where only background noise is left
+NOISE_FLOOR_ENERGY = SILENCE_ENERGY / 10
+# The rules above are applied to frames of this many samples (20 ms at 16 kHz), so that
+# a short word is not averaged away by the silence around it
+SILENCE_FRAME_SAMPLES = 320
+
+
+if njit is not None:
+    @njit(cache=True)
+    def speech_score(samples):
+        """
+        Returns (mean square energy, zero-crossing count) of int16 samples,
+        computed in a single pass on the raw integers.
+        """
+        if samples.size == 0:
+            return 0.0, 0
+        energy = 0
+        crossings = 0
+        prev = np.int64(samples[0])
+        for i in range(samples.size):
+            value = np.int64(samples[i])
+            energy += value * value
+            if (value ^ prev) < 0:
+                crossings += 1
+            prev = value
+        return energy / samples.size, crossings
+
+
+    @njit(cache=True)
+    def all_frames_silent(samples, frame_size):
+        """
+        True if every frame of `frame_size` int16 samples is silent. The last
+        frame may be shorter.
+        """
+        for start in range(0, samples.size, frame_size):
+            frame = samples[start:start + frame_size]
+            energy, crossings = speech_score(frame)
+            if energy < NOISE_FLOOR_ENERGY:
+                continue
+            if energy >= SILENCE_ENERGY or crossings / frame.size >= SILENCE_ZERO_CROSSING_RATE:
+                return False
+        return True
+
+    @njit(cache=True)
+    def _scale_pcm16(samples, out):
+        for i in range(samples.size):
+            out[i] = samples[i] * PCM_SCALE
+else:
+    # Same results with whole-array NumPy operations, slower than the compiled loops
+
+    def all_frames_silent(samples, frame_size):
+        values = samples.astype(np.int64)
+        starts = np.arange(0, values.size, frame_size)
+        sizes = np.diff(np.append(starts, values.size))
+        energy = np.add.reduceat(values * values, starts) / sizes
+        # Sign changes between consecutive samples, not counted across frame boundaries
+        changes = np.empty(values.size, dtype=np.int64)
+        changes[0] = 0
+        changes[1:] = (values[1:] ^ values[:-1]) < 0
+        changes[starts] = 0
+        crossings = np.add.reduceat(changes, starts)
+        silent = (energy < NOISE_FLOOR_ENERGY) | (
+            (energy < SILENCE_ENERGY) & (crossings / sizes < SILENCE_ZERO_CROSSING_RATE)
+        )
+        return bool(silent.all())
+
+    def _scale_pcm16(samples, out):
+        np.multiply(samples, PCM_SCALE, out=out, dtype=np.float32)
+
+
+def is_silence(samples: np.ndarray) -> bool:
+    """
+    Cheap energy / zero-crossing pre-filter for int16 PCM, meant to run before
+    any float conversion or Whisper call. A span is silent only if all of its
+    SILENCE_FRAME_SAMPLES frames are.
+    """
+    if samples.size == 0:
+        return True
+    return all_frames_silent(samples, SILENCE_FRAME_SAMPLES)
+
+
+def pcm16_to_float32(pcm, out: np.ndarray) -> np.ndarray:
+    """
+    Convert s16le PCM bytes to float32 samples in [-1, 1), written into `out`.
+    The cast and the scaling are fused in one pass, without allocating
+    intermediate arrays. Returns the filled view of `out`.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2)
+    view = out[:samples.size]
+    _scale_pcm16(samples, view)
+    return view
+
+
+def warmup_kernels():
+    """
+    Compiles the numba kernels, or loads them from the cache, so that the first
+    session does not block the event loop on it. The argument types match the
+    views over PCMBuffer's storage used by the server.
+    """
+    pcm = memoryview(bytearray(2 * SILENCE_FRAME_SAMPLES))
+    is_silence(np.frombuffer(pcm, dtype=np.int16))
+    pcm16_to_float32(pcm, np.empty(SILENCE_FRAME_SAMPLES, dtype=np.float32))
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import sys
 import numpy as np
 import librosa
@@ -12,17 +13,29 @@ logger = logging.getLogger(__name__)
 
 
 
-WHISPER_LANG_CODES = "af,am,ar,as,az,ba,be,bg,bn,bo,br,bs,ca,cs,cy,da,de,el,en,es,et,eu,fa,fi,fo,fr,gl,gu,ha,haw,he,hi,hr,ht,hu,hy,id,is,it,ja,jw,ka,kk,km,kn,ko,la,lb,ln,lo,lt,lv,mg,mi,mk,ml,mn,mr,ms,mt,my,ne,nl,nn,no,oc,pa,pl,ps,pt,ro,ru,sa,sd,si,sk,sl,sn,so,sq,sr,su,sv,sw,ta,te,tg,th,tk,tl,tr,tt,uk,ur,uz,vi,yi,yo,zh".split(
+WHISPER_LANG_CODES = frozenset("af,am,ar,as,az,ba,be,bg,bn,bo,br,bs,ca,cs,cy,da,de,el,en,es,et,eu,fa,fi,fo,fr,gl,gu,ha,haw,he,hi,hr,ht,hu,hy,id,is,it,ja,jw,ka,kk,km,kn,ko,la,lb,ln,lo,lt,lv,mg,mi,mk,ml,mn,mr,ms,mt,my,ne,nl,nn,no,oc,pa,pl,ps,pt,ro,ru,sa,sd,si,sk,sl,sn,so,sq,sr,su,sv,sw,ta,te,tg,th,tk,tl,tr,tt,uk,ur,uz,vi,yi,yo,zh".split(
     ","
+))
+
+# supported by fast-mosestokenizer
+MOSES_LANGS = frozenset(
+    "as bn ca cs de el en es et fi fr ga gu hi hu is it kn lt lv ml mni mr nl or pa pl pt ro ru sk sl sv ta te yue zh".split()
+)
+
+# the following languages are in Whisper, but not in wtpsplit
+WTPSPLIT_UNSUPPORTED_LANGS = frozenset(
+    "as ba bo br bs fo haw hr ht jw lb ln lo mi nn oc sa sd sn so su sw tk tl tt".split()
 )
 
 
+@lru_cache(maxsize=8)
 def create_tokenizer(lan):
-    """returns an object that has split function that works like the one of MosesTokenizer"""
+    """returns an object that has split function that works like the one of MosesTokenizer.
+    Cached per language, so the sentence splitter models are loaded only once."""
 
     assert (
         lan in WHISPER_LANG_CODES
-    ), "language must be Whisper's supported lang code: " + " ".join(WHISPER_LANG_CODES)
+    ), "language must be Whisper's supported lang code: " + " ".join(sorted(WHISPER_LANG_CODES))
 
     if lan == "uk":
         import tokenize_uk
@@ -33,20 +46,12 @@ def create_tokenizer(lan):
 
         return UkrainianTokenizer()
 
-    # supported by fast-mosestokenizer
-    if (
-        lan
-        in "as bn ca cs de el en es et fi fr ga gu hi hu is it kn lt lv ml mni mr nl or pa pl pt ro ru sk sl sv ta te yue zh".split()
-    ):
+    if lan in MOSES_LANGS:
         from mosestokenizer import MosesSentenceSplitter        
 
         return MosesSentenceSplitter(lan)
 
-    # the following languages are in Whisper, but not in wtpsplit:
-    if (
-        lan
-        in "as ba bo br bs fo haw hr ht jw lb ln lo mi nn oc sa sd sn so su sw tk tl tt".split()
-    ):
+    if lan in WTPSPLIT_UNSUPPORTED_LANGS:
         logger.debug(
             f"{lan} code is not supported by wtpsplit. Going to use None lang_code option."
         )
@@ -64,6 +69,23 @@ def create_tokenizer(lan):
     return WtPtok()
 
 
+def warmup_asr(asr, warmup_file=None):
+    """
+    Transcribes the first seconds of warmup_file once, so that kernel compilation
+    and memory allocation happen before the first client chunk is processed.
+    """
+    if not warmup_file:
+        logger.warning("Whisper is not warmed up. The first chunk processing may take longer.")
+        return
+    if not os.path.isfile(warmup_file):
+        logger.warning(f"Warmup file {warmup_file} not found. Whisper is not warmed up.")
+        return
+    t = time.time()
+    audio, _ = librosa.load(warmup_file, sr=16000, duration=5, dtype=np.float32)
+    asr.transcribe(audio)
+    logger.info(f"Whisper is warmed up. It took {round(time.time()-t,2)} seconds.")
+
+
 def add_shared_args(parser):
     """shared args for simulation (this entry point) and server
     parser: argparse.ArgumentParser object
@@ -116,6 +138,21 @@ def add_shared_args(parser):
         choices=["faster-whisper", "whisper_timestamped", "mlx-whisper", "openai-api"],
         help="Load only this backend for Whisper processing.",
     )
+    parser.add_argument(
+        "--compute-type",
+        type=str,
+        default=None,
+        dest="compute_type",
+        choices=["float32", "float16", "bfloat16", "int8_float16", "int8"],
+        help="Precision of the model weights and computations. Defaults to int8_float16 on CUDA and int8 on CPU for faster-whisper, float16 for mlx-whisper, which only supports float16 and float32.",
+    )
+    parser.add_argument(
+        "--cpu-threads",
+        type=int,
+        default=0,
+        dest="cpu_threads",
+        help="faster-whisper only: number of threads per transcription on CPU. 0 keeps the CTranslate2 default.",
+    )
     parser.add_argument(
         "--vac",
         action="store_true",
@@ -153,20 +190,29 @@ def add_shared_args(parser):
         default="DEBUG",
     )
 
-def backend_factory(args):
+def asr_class(backend):
+    """Returns the ASRBase subclass implementing `backend`."""
+    if backend == "openai-api":
+        return OpenaiApiASR
+    if backend == "faster-whisper":
+        return FasterWhisperASR
+    if backend == "mlx-whisper":
+        return MLXWhisper
+    return WhisperTimestampedASR
+
+
+def create_asr(args):
+    """Loads the ASR backend chosen in args, with VAD and translation applied."""
     backend = args.backend
+    asr_cls = asr_class(backend)
     if backend == "openai-api":
         logger.info("Using OpenAI API.")
         asr = OpenaiApiASR(lan=args.lan)
     else:
         if backend == "faster-whisper":
             logger.info("Using Faster Whisper.")
-            asr_cls = FasterWhisperASR
-        elif backend == "mlx-whisper":
-            asr_cls = MLXWhisper
-        else:
+        elif backend != "mlx-whisper":
             logger.info("Using Simple Whisper.")
-            asr_cls = WhisperTimestampedASR
 
         # Only for FasterWhisperASR and WhisperTimestampedASR
         size = args.model
@@ -177,6 +223,8 @@ def backend_factory(args):
             lan=args.lan,
             cache_dir=args.model_cache_dir,
             model_dir=args.model_dir,
+            compute_type=args.compute_type,
+            cpu_threads=args.cpu_threads,
         )
         e = time.time()
         logger.info(f"done. It took {round(e-t,2)} seconds.")
@@ -186,20 +234,25 @@ def backend_factory(args):
         logger.info("Setting VAD filter")
         asr.use_vad()
 
-    language = args.lan
     if args.task == "translate":
         asr.set_translate_task()
+    return asr
+
+
+def tokenizer_factory(args):
+    """Returns the sentence tokenizer for the "sentence" buffer trimming, None otherwise."""
+    if args.task == "translate":
         tgt_language = "en"  # Whisper translates into English
     else:
-        tgt_language = language  # Whisper transcribes in this language
+        tgt_language = args.lan  # Whisper transcribes in this language
 
-    # Create the tokenizer
     if args.buffer_trimming == "sentence":
+        return create_tokenizer(tgt_language)
+    return None
 
-        tokenizer = create_tokenizer(tgt_language)
-    else:
-        tokenizer = None
-    return asr, tokenizer
+
+def backend_factory(args):
+    return create_asr(args), tokenizer_factory(args)
 
 def online_factory(args, asr, tokenizer, logfile=sys.stderr):
     if args.vac:
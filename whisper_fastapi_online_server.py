@@ -1,21 +1,31 @@
 import io
+import os
+import json
 import argparse
 import asyncio
+import threading
 import numpy as np
+import torch
 import ffmpeg
-from time import time
+from time import monotonic_ns
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from src.whisper_streaming.whisper_online import backend_factory, online_factory, add_shared_args
+from src.whisper_streaming.whisper_online import backend_factory, online_factory, add_shared_args, warmup_asr, tokenizer_factory
+from src.whisper_streaming.asr_workers import ASRProcessPool, LockedTokenizer
+from src.whisper_streaming.pcm_kernels import is_silence, pcm16_to_float32, warmup_kernels
 
 import subprocess
-import math
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logging.getLogger().setLevel(logging.WARNING)
@@ -34,11 +44,24 @@ parser.add_argument(
 parser.add_argument(
     "--port", type=int, default=8000, help="The port number to bind the server to."
 )
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of server processes. Each one loads its own copy of the Whisper model.",
+)
+parser.add_argument(
+    "--asr-workers",
+    type=int,
+    default=0,
+    dest="asr_workers",
+    help="Number of subprocesses running the Whisper model, each with its own copy, shared by all the sessions of a server process. 0 runs the model in the server process.",
+)
 parser.add_argument(
     "--warmup-file",
     type=str,
     dest="warmup_file",
-    help="The path to a speech audio wav file to warm up Whisper so that the very first chunk processing is fast. It can be e.g. https://github.com/ggerganov/whisper.cpp/raw/master/samples/jfk.wav .",
+    help="The path to a local speech audio wav file to warm up Whisper so that the very first chunk processing is fast. It can be e.g. https://github.com/ggerganov/whisper.cpp/raw/master/samples/jfk.wav downloaded beforehand.",
 )
 
 parser.add_argument(
@@ -48,6 +71,13 @@ parser.add_argument(
     help="Whether to enable speaker diarization.",
 )
 
+parser.add_argument(
+    "--silence-gate",
+    action="store_true",
+    default=False,
+    help="Skip the Whisper pass on chunks that a cheap energy / zero-crossing check finds silent. Without --vac, pending text is finalized when the silence starts.",
+)
+
 
 add_shared_args(parser)
 args = parser.parse_args()
@@ -58,6 +88,9 @@ SAMPLES_PER_SEC = SAMPLE_RATE * int(args.min_chunk_size)
 BYTES_PER_SAMPLE = 2  # s16le = 2 bytes per sample
 BYTES_PER_SEC = SAMPLES_PER_SEC * BYTES_PER_SAMPLE
 MAX_BYTES_PER_SEC = 32000 * 5 # 5 seconds of audio at 32 kHz
+# The unvalidated buffer can only repeat recent text, so only this much of the transcription is kept for the check
+TRANSCRIPTION_TAIL_CHARS = 4096
+AUDIO_FORMATS = ("webm", "pcm16")  # pcm16 = raw s16le, mono, SAMPLE_RATE
 
 if args.diarization:
     from src.diarization.diarization_online import DiartDiarization
@@ -68,8 +101,22 @@ if args.diarization:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global asr, tokenizer
-    asr, tokenizer = backend_factory(args)
+    if args.workers > 1:
+        # Share the cores between the server processes instead of each one using all of them
+        torch.set_num_threads(max(1, os.cpu_count() // args.workers))
+    warmup_kernels()
+    if args.asr_workers > 0:
+        asr = ASRProcessPool(args, args.asr_workers, warmup_file=args.warmup_file)
+        asr.start()
+        tokenizer = tokenizer_factory(args)
+        if tokenizer is not None:  # Sessions call it concurrently from executor threads
+            tokenizer = LockedTokenizer(tokenizer)
+    else:
+        asr, tokenizer = backend_factory(args)
+        warmup_asr(asr, args.warmup_file)
     yield
+    if args.asr_workers > 0:
+        asr.close()
 
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(
@@ -89,21 +136,131 @@ async def start_ffmpeg_decoder():
     """
     Start an FFmpeg process in async streaming mode that reads WebM from stdin
     and outputs raw s16le PCM on stdout. Returns the process object.
+    Probing, input buffering and output buffering are disabled so that PCM
+    comes out as soon as the first WebM cluster is in.
     """
-    process = (
-        ffmpeg.input("pipe:0", format="webm")
+    cmd = (
+        ffmpeg.input(
+            "pipe:0",
+            format="webm",
+            fflags="nobuffer+discardcorrupt",
+            flags="low_delay",
+            probesize=32,
+            analyzeduration=0,
+        )
         .output(
             "pipe:1",
             format="s16le",
             acodec="pcm_s16le",
             ac=CHANNELS,
             ar=str(SAMPLE_RATE),
+            avioflags="direct",
+            flush_packets=1,
         )
-        .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+        .compile()
+    )
+    # Same as run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True), with an unbuffered stdout
+    process = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0
     )
+    # A raw pipe write may be partial, a buffered writer writes the whole message before flush returns
+    process.stdin = io.BufferedWriter(process.stdin)
     return process
 
 
+def pump_ffmpeg_stdout(stdout, pcm_buffer, queue, loop):
+    """
+    Blocking loop run on a dedicated thread: reads FFmpeg stdout into a
+    preallocated buffer, appends it to `pcm_buffer` and queues the number of
+    bytes written on the event loop. 0 is queued once the pipe is closed.
+    """
+    read_buffer = bytearray(MAX_BYTES_PER_SEC)
+    read_view = memoryview(read_buffer)
+    beg = monotonic_ns()  # Monotonic, so that wall clock adjustments cannot skew the read size
+    while True:
+        # Read at most what FFmpeg produced since the previous read
+        now = monotonic_ns()
+        elapsed_ms = (now - beg) // 100_000_000 * 100  # Round down to 0.1 sec
+        ffmpeg_buffer_from_duration = min(max(32000 * elapsed_ms // 1000, 4096), len(read_buffer))
+        beg = now
+        try:
+            n = stdout.readinto(read_view[:ffmpeg_buffer_from_duration]) or 0
+        except (OSError, ValueError):
+            n = 0
+        if n:
+            with pcm_buffer.lock:
+                pcm_buffer.write(read_view[:n])
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, n)
+        except RuntimeError:  # Event loop already closed
+            return
+        if not n:
+            return
+
+
+class PCMBuffer:
+    """
+    Byte buffer for the s16le PCM produced by FFmpeg.
+
+    Consuming audio advances a read index instead of slicing the front off,
+    so reads never copy the unread tail. Unread bytes are moved back to the
+    start of the storage only when a write would not fit at the end, and the
+    storage only grows when the backlog exceeds its capacity.
+
+    Writes from the FFmpeg pump thread and reads on the event loop, including
+    the use of the returned view, must hold `lock`.
+    """
+
+    def __init__(self, capacity: int):
+        self.lock = threading.Lock()
+        self._storage = bytearray(capacity)
+        self._head = 0
+        self._tail = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def clear(self):
+        self._head = 0
+        self._tail = 0
+
+    def write(self, data):
+        size = len(data)
+        if self._tail + size > len(self._storage):
+            unread = len(self)
+            self._storage[:unread] = self._storage[self._head:self._tail]
+            self._head, self._tail = 0, unread
+            if unread + size > len(self._storage):
+                self._storage.extend(bytes(unread + size - len(self._storage)))
+        self._storage[self._tail:self._tail + size] = data
+        self._tail += size
+
+    def read(self, size: int) -> memoryview:
+        """
+        Consume up to `size` bytes and return a view over them. The view must
+        be released before the next write, e.g. by using it as a context manager.
+        """
+        size = min(size, len(self))
+        view = memoryview(self._storage)[self._head:self._head + size]
+        self._head += size
+        if self._head == self._tail:
+            self.clear()
+        return view
+
+
+def add_chunk_to_lines(lines, chunk):
+    """Append a chunk_history entry to `lines`, starting a new line when the speaker changes."""
+    if args.diarization and chunk["speaker"] and chunk["speaker"][-1] != lines[-1]["speaker"]:
+        lines.append(
+            {
+                "speaker": chunk["speaker"][-1],
+                "text": chunk['text']
+            }
+        )
+    else:
+        lines[-1]["text"] += chunk['text']
+
+
 ##### ENDPOINTS #####
 
 @app.get("/")
@@ -115,117 +272,178 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connection opened.")
 
+    # Clients may open with a JSON header such as {"format": "pcm16"}. PCM is fed
+    # to the model as is, without FFmpeg. Anything else is decoded as WebM, and
+    # clients that start streaming audio right away are treated as WebM.
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        logger.warning("WebSocket disconnected.")
+        return
+    first_audio = message.get("bytes")
+    audio_format = "webm"
+    if message.get("text") is not None:
+        try:
+            audio_format = json.loads(message["text"]).get("format", "webm")
+        except (ValueError, AttributeError):
+            audio_format = None
+        if audio_format not in AUDIO_FORMATS:
+            logger.warning(f"Unsupported audio format header: {message['text']}")
+            await websocket.close(code=1003, reason=f"format must be one of {', '.join(AUDIO_FORMATS)}")
+            return
+    logger.info(f"Receiving {audio_format} audio.")
+
+    loop = asyncio.get_running_loop()
     ffmpeg_process = None
-    pcm_buffer = bytearray()
+    pcm_buffer = PCMBuffer(2 * MAX_BYTES_PER_SEC)
+    # Sizes of the chunks added to pcm_buffer by pump_ffmpeg_stdout or by pcm16 clients, 0 ends the stream
+    pcm_chunks = asyncio.Queue()
+    # Reused float32 buffer for the int16 -> float32 conversion, grown if a backlog does not fit
+    pcm_scratch = np.empty(MAX_BYTES_PER_SEC // BYTES_PER_SAMPLE, dtype=np.float32)
     online = online_factory(args, asr, tokenizer)
     diarization = DiartDiarization(SAMPLE_RATE) if args.diarization else None
 
     async def restart_ffmpeg():
-        nonlocal ffmpeg_process, online, diarization, pcm_buffer
+        nonlocal ffmpeg_process, pcm_buffer, pcm_chunks, diarization
         if ffmpeg_process:
             try:
                 ffmpeg_process.kill()
-                await asyncio.get_event_loop().run_in_executor(None, ffmpeg_process.wait)
+                await loop.run_in_executor(None, ffmpeg_process.wait)
             except Exception as e:
                 logger.warning(f"Error killing FFmpeg process: {e}")
         ffmpeg_process = await start_ffmpeg_decoder()
-        pcm_buffer = bytearray()
-        online = online_factory(args, asr, tokenizer)
+        # Each process gets its own buffer and queue, so a dying pump cannot feed the new session
+        pcm_buffer = PCMBuffer(2 * MAX_BYTES_PER_SEC)
+        pcm_chunks = asyncio.Queue()
+        threading.Thread(
+            target=pump_ffmpeg_stdout,
+            args=(ffmpeg_process.stdout, pcm_buffer, pcm_chunks, loop),
+            daemon=True,
+        ).start()
         if args.diarization:
             diarization = DiartDiarization(SAMPLE_RATE)
         logger.info("FFmpeg process started.")
 
-    await restart_ffmpeg()
+    if audio_format == "webm":
+        await restart_ffmpeg()
 
     async def ffmpeg_stdout_reader():
-        nonlocal ffmpeg_process, online, diarization, pcm_buffer
-        loop = asyncio.get_event_loop()
-        full_transcription = ""
-        beg = time()
+        nonlocal ffmpeg_process, online, diarization, pcm_scratch
+        transcription_tail = ""  # Last TRANSCRIPTION_TAIL_CHARS characters of the committed text
+        in_silence = False
         
         chunk_history = []  # Will store dicts: {beg, end, text, speaker}
+        lines = [{"speaker": "0", "text": ""}]  # chunk_history grouped by speaker, updated incrementally
+        chunks = pcm_chunks  # Queue of the FFmpeg process that `online` is fed from
         
         while True:
             try:
-                elapsed_time = math.floor((time() - beg) * 10) / 10 # Round to 0.1 sec
-                ffmpeg_buffer_from_duration = max(int(32000 * elapsed_time), 4096)
-                beg = time()
+                if chunks is not pcm_chunks:
+                    # FFmpeg was restarted: reset the processor in place, keeping its tokenizer
+                    # and VAD model. This is done here rather than in restart_ffmpeg, so that it
+                    # never happens under a process_iter running in an executor thread.
+                    chunks = pcm_chunks
+                    online.init()
 
                 # Read chunk with timeout
                 try:
-                    chunk = await asyncio.wait_for(
-                        loop.run_in_executor(
-                            None, ffmpeg_process.stdout.read, ffmpeg_buffer_from_duration
-                        ),
-                        timeout=5.0
-                    )
+                    n_received = await asyncio.wait_for(chunks.get(), timeout=5.0)
                 except asyncio.TimeoutError:
+                    if ffmpeg_process is None:
+                        continue  # pcm16 client is silent, there is no decoder to restart
                     logger.warning("FFmpeg read timeout. Restarting...")
-                    await restart_ffmpeg()
-                    full_transcription = ""
+                    await restart_ffmpeg()  # online is reset on the next iteration
+                    transcription_tail = ""
+                    in_silence = False
                     chunk_history = []
-                    beg = time()
+                    lines = [{"speaker": "0", "text": ""}]
                     continue  # Skip processing and read from new process
 
-                if not chunk:
+                if chunks is not pcm_chunks:
+                    # feed_audio restarted FFmpeg while we waited. This item, possibly the
+                    # EOF of the killed process, belongs to the old queue: reset and read the new one.
+                    continue
+
+                if not n_received:
                     logger.info("FFmpeg stdout closed.")
                     break
 
-                pcm_buffer.extend(chunk)
+                # Take in everything already queued, so a backlog is handled by a single Whisper pass
+                while not pcm_chunks.empty():
+                    if not pcm_chunks.get_nowait():
+                        pcm_chunks.put_nowait(0)  # Stop on the next iteration, after this audio
+                        break
+
                 if len(pcm_buffer) >= BYTES_PER_SEC:
                     if len(pcm_buffer) > MAX_BYTES_PER_SEC:
                         logger.warning(
                             f"""Audio buffer is too large: {len(pcm_buffer) / BYTES_PER_SEC:.2f} seconds.
                             The model probably struggles to keep up. Consider using a smaller model.
                             """)
-                    # Convert int16 -> float32
-                    pcm_array = (
-                        np.frombuffer(pcm_buffer[:MAX_BYTES_PER_SEC], dtype=np.int16).astype(np.float32)
-                        / 32768.0
-                    )
-                    pcm_buffer = pcm_buffer[MAX_BYTES_PER_SEC:]
-                    logger.info(f"{len(online.audio_buffer) / online.SAMPLING_RATE} seconds of audio will be processed by the model.")
-                    online.insert_audio_chunk(pcm_array)
-                    transcription = online.process_iter()
+                    # Convert the whole backlog int16 -> float32, leaving a trailing odd byte for the next read
+                    n_bytes = len(pcm_buffer) - len(pcm_buffer) % BYTES_PER_SAMPLE
+                    if n_bytes // BYTES_PER_SAMPLE > pcm_scratch.size:
+                        pcm_scratch = np.empty(n_bytes // BYTES_PER_SAMPLE, dtype=np.float32)
+                    with pcm_buffer.lock, pcm_buffer.read(n_bytes) as pcm_view:
+                        silent = args.silence_gate and is_silence(np.frombuffer(pcm_view, dtype=np.int16))
+                        if silent:
+                            # No float conversion needed, silence is passed on as zeros
+                            pcm_array = pcm_scratch[:n_bytes // BYTES_PER_SAMPLE]
+                            pcm_array.fill(0)
+                        else:
+                            pcm_array = pcm16_to_float32(pcm_view, pcm_scratch)
+
+                    if silent and not args.vac:
+                        # Skip Whisper: finalize what is pending when the silence starts,
+                        # then only move the processor's timeline past the silent audio.
+                        transcription = online.finish() if not in_silence else None
+                        online.init(offset=online.buffer_time_offset + len(pcm_array) / online.SAMPLING_RATE)
+                    else:
+                        # With VAC, the zeros let the VAD detect the end of speech
+                        logger.info(f"{len(online.audio_buffer) / online.SAMPLING_RATE} seconds of audio will be processed by the model.")
+                        online.insert_audio_chunk(pcm_array)
+                        if args.asr_workers > 0:
+                            # Wait for the worker process without holding up the other sessions
+                            transcription = await loop.run_in_executor(None, online.process_iter)
+                        else:
+                            transcription = online.process_iter()
+                    in_silence = silent
                     
-                    if transcription:
+                    if transcription and transcription.text:
                         chunk_history.append({
                             "beg": transcription.start,
                             "end": transcription.end,
                             "text": transcription.text,
                             "speaker": "0"
                         })
+                        transcription_tail = (transcription_tail + transcription.text)[-TRANSCRIPTION_TAIL_CHARS:]
+                    else:
+                        transcription = None
 
-                    full_transcription += transcription.text if transcription else ""
                     buffer = online.get_buffer()
                   
-                    if buffer in full_transcription: # With VAC, the buffer is not updated until the next chunk is processed
+                    if buffer in transcription_tail: # With VAC, the buffer is not updated until the next chunk is processed
                         buffer = ""
-                                        
-                    lines = [
-                        {
-                            "speaker": "0",
-                            "text": "",
-                        }
-                    ]
                     
+                    rebuild_lines = False
                     if args.diarization:
                         await diarization.diarize(pcm_array)
+                        # New speaker segments may relabel past chunks, not only the latest one
+                        rebuild_lines = bool(diarization.segment_speakers)
                         diarization.assign_speakers_to_chunks(chunk_history)
 
-                    for ch in chunk_history:
-                        if args.diarization and ch["speaker"] and ch["speaker"][-1] != lines[-1]["speaker"]:
-                            lines.append(
-                                {
-                                    "speaker": ch["speaker"][-1],
-                                    "text": ch['text']
-                                }
-                            )
-                        else:
-                            lines[-1]["text"] += ch['text']
+                    if rebuild_lines:
+                        lines = [{"speaker": "0", "text": ""}]
+                        for ch in chunk_history:
+                            add_chunk_to_lines(lines, ch)
+                    elif transcription:
+                        add_chunk_to_lines(lines, chunk_history[-1])
 
                     response = {"lines": lines, "buffer": buffer}
-                    await websocket.send_json(response)
+                    if orjson is not None:
+                        # Sent as a text frame like send_json, which the web client expects
+                        await websocket.send_text(orjson.dumps(response).decode())
+                    else:
+                        await websocket.send_json(response)
                     
             except Exception as e:
                 logger.warning(f"Exception in ffmpeg_stdout_reader: {e}")
@@ -235,18 +453,28 @@ async def websocket_endpoint(websocket: WebSocket):
 
     stdout_reader_task = asyncio.create_task(ffmpeg_stdout_reader())
 
+    async def feed_audio(message):
+        if audio_format == "pcm16":
+            if message:  # An empty chunk would read as end of stream
+                with pcm_buffer.lock:
+                    pcm_buffer.write(message)
+                pcm_chunks.put_nowait(len(message))
+            return
+        try:
+            ffmpeg_process.stdin.write(message)
+            ffmpeg_process.stdin.flush()
+        except (BrokenPipeError, AttributeError) as e:
+            logger.warning(f"Error writing to FFmpeg: {e}. Restarting...")
+            await restart_ffmpeg()
+            ffmpeg_process.stdin.write(message)
+            ffmpeg_process.stdin.flush()
+
     try:
+        if first_audio:
+            await feed_audio(first_audio)
         while True:
-            # Receive incoming WebM audio chunks from the client
-            message = await websocket.receive_bytes()
-            try:
-                ffmpeg_process.stdin.write(message)
-                ffmpeg_process.stdin.flush()
-            except (BrokenPipeError, AttributeError) as e:
-                logger.warning(f"Error writing to FFmpeg: {e}. Restarting...")
-                await restart_ffmpeg()
-                ffmpeg_process.stdin.write(message)
-                ffmpeg_process.stdin.flush()
+            # Receive incoming WebM or PCM audio chunks from the client
+            await feed_audio(await websocket.receive_bytes())
     except WebSocketDisconnect:
         logger.warning("WebSocket disconnected.")
     finally:
@@ -264,7 +492,8 @@ async def websocket_endpoint(websocket: WebSocket):
 if __name__ == "__main__":
     import uvicorn
 
+    # uvicorn picks uvloop and httptools when they are installed. Both are in pyproject.toml; with pip, install "uvicorn[standard]"
     uvicorn.run(
-        "whisper_fastapi_online_server:app", host=args.host, port=args.port, reload=True,
-        log_level="info"
+        "whisper_fastapi_online_server:app", host=args.host, port=args.port, workers=args.workers,
+        loop="auto", http="auto", log_level="info"
     )
\ No newline at end of file